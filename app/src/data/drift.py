@@ -0,0 +1,187 @@
+import numpy as np
+
+# label used for the categories grouped or missing in the profiles
+OTHER_CATEGORY = '__other__'
+MISSING_CATEGORY = '__missing__'
+
+
+def compute_data_profile(df, bins=10, max_categories=20):
+    """
+        Function to compute a compact profile of the data (histograms
+        and summary statistics per feature) to detect drift later.
+
+        Args:
+           df (DataFrame):  Dataset.
+
+        Kwargs:
+           bins (int):  Number of quantile bins of the numeric features.
+           max_categories (int):  Most frequent categories kept per
+           categorical feature.
+
+        Returns:
+           dict. Data profile.
+    """
+    profile = {'n_rows': int(len(df)), 'numeric': {}, 'categorical': {}}
+
+    # numeric features: all of them are profiled in one vectorized pass
+    numeric_df = df.select_dtypes(include='number')
+    if numeric_df.shape[1] > 0:
+        values = numeric_df.to_numpy(dtype=float)
+        nulls = np.isnan(values)
+        # quantile edges of each feature (rows: edges, columns: features)
+        with np.errstate(all='ignore'):
+            edges = np.nanquantile(np.where(nulls.all(axis=0), 0.0, values),
+                                   np.linspace(0, 1, bins + 1), axis=0)
+        freqs = get_histograms(values, edges)
+        with np.errstate(all='ignore'):
+            means = np.nanmean(values, axis=0)
+            stds = np.nanstd(values, axis=0)
+        null_rates = nulls.mean(axis=0) if len(df) else np.zeros(values.shape[1])
+
+        for i, col in enumerate(numeric_df.columns):
+            profile['numeric'][col] = {
+                'edges': to_json_list(edges[:, i]),
+                'freqs': to_json_list(freqs[i]),
+                'mean': to_json_list([means[i]])[0],
+                'std': to_json_list([stds[i]])[0],
+                'null_rate': float(null_rates[i])
+            }
+
+    # categorical features: frequency of the most common categories
+    for col in df.columns.difference(numeric_df.columns):
+        freqs = df[col].astype(object).fillna(MISSING_CATEGORY).astype(str).value_counts(normalize=True)
+        top = freqs.iloc[:max_categories]
+        profile['categorical'][col] = {str(k): float(v) for k, v in top.items()}
+        if len(freqs) > max_categories:
+            profile['categorical'][col][OTHER_CATEGORY] = float(freqs.iloc[max_categories:].sum())
+
+    return profile
+
+
+def get_histograms(values, edges):
+    """
+        Function to compute the relative histograms of all the features
+        at once using their own bin edges. The last bin of each feature
+        holds its missing values.
+
+        Args:
+           values (ndarray):  Matrix of data (rows x features).
+           edges (ndarray):  Bin edges (edges x features).
+
+        Returns:
+           ndarray. Relative frequencies (features x bins + 1).
+    """
+    n_features = values.shape[1]
+    # value bins plus the bin of missing values
+    bins = edges.shape[0]
+
+    # bin index of each value, counting the inner edges it exceeds
+    idx = np.zeros(values.shape, dtype=np.int64)
+    with np.errstate(invalid='ignore'):
+        for edge in edges[1:-1]:
+            idx += values > edge
+
+    # a single bincount for all the features (nulls go to the last bin)
+    idx[np.isnan(values)] = bins - 1
+    flat_idx = (idx + np.arange(n_features) * bins).ravel()
+    counts = np.bincount(flat_idx, minlength=n_features * bins).reshape(n_features, bins)
+    totals = counts.sum(axis=1, keepdims=True)
+
+    return counts / np.maximum(totals, 1)
+
+
+def compute_drift(reference_profile, df, epsilon=1e-4):
+    """
+        Function to compute the Population Stability Index (PSI) of
+        each feature between a reference profile and new data.
+
+        Args:
+           reference_profile (dict):  Profile of the training data.
+           df (DataFrame):  New dataset.
+
+        Kwargs:
+           epsilon (float):  Minimum frequency to avoid log(0).
+
+        Returns:
+           dict. PSI of each feature.
+    """
+    drift = {}
+
+    # numeric features, binned with the reference edges in one pass
+    numeric_cols = [col for col in reference_profile['numeric'] if col in df.columns]
+    if numeric_cols:
+        values = df[numeric_cols].to_numpy(dtype=float)
+        edges = np.array([reference_profile['numeric'][col]['edges'] for col in numeric_cols],
+                         dtype=float).T
+        actual = get_histograms(values, edges)
+        expected = np.array([get_reference_freqs(reference_profile['numeric'][col]) for col in numeric_cols])
+        psi = get_psi(expected, actual, epsilon)
+        drift.update({col: float(psi[i]) for i, col in enumerate(numeric_cols)})
+
+    # categorical features, using the categories of the reference
+    for col, ref_freqs in reference_profile['categorical'].items():
+        if col not in df.columns:
+            continue
+        categories = df[col].astype(object).fillna(MISSING_CATEGORY).astype(str)
+        known = [cat for cat in ref_freqs if cat != OTHER_CATEGORY]
+        categories = categories.where(categories.isin(known), OTHER_CATEGORY)
+        freqs = categories.value_counts(normalize=True)
+        labels = list(ref_freqs) + ([OTHER_CATEGORY] if OTHER_CATEGORY not in ref_freqs else [])
+        expected = np.array([[ref_freqs.get(cat, 0.0) for cat in labels]])
+        actual = np.array([[freqs.get(cat, 0.0) for cat in labels]])
+        drift[col] = float(get_psi(expected, actual, epsilon)[0])
+
+    return drift
+
+
+def get_reference_freqs(feature_profile):
+    """
+        Function to get the frequencies of a numeric feature profile,
+        including the bin of missing values. Profiles saved without that
+        bin are rebuilt using their null rate.
+
+        Args:
+           feature_profile (dict):  Profile of a numeric feature.
+
+        Returns:
+           list. Relative frequencies (bins + 1).
+    """
+    freqs = feature_profile['freqs']
+    if len(freqs) == len(feature_profile['edges']):
+        return freqs
+
+    null_rate = feature_profile['null_rate']
+    return [freq * (1 - null_rate) for freq in freqs] + [null_rate]
+
+
+def get_psi(expected, actual, epsilon=1e-4):
+    """
+        Function to compute the Population Stability Index by rows.
+
+        Args:
+           expected (ndarray):  Reference frequencies (features x bins).
+           actual (ndarray):  New frequencies (features x bins).
+
+        Kwargs:
+           epsilon (float):  Minimum frequency to avoid log(0).
+
+        Returns:
+           ndarray. PSI of each row.
+    """
+    expected = np.clip(np.asarray(expected, dtype=float), epsilon, None)
+    actual = np.clip(np.asarray(actual, dtype=float), epsilon, None)
+    return ((actual - expected) * np.log(actual / expected)).sum(axis=1)
+
+
+def to_json_list(values):
+    """
+        Function to convert an array to a JSON compatible list
+        (NaN and infinite values are not valid in the database).
+
+        Args:
+           values (array):  Values to convert.
+
+        Returns:
+           list. Converted values.
+    """
+    return [float(v) if np.isfinite(v) else None for v in np.asarray(values, dtype=float)]
@@ -6,7 +6,7 @@ from ..features.feature_engineering import feature_engineering
 from app import cos
 
 
-def make_dataset(path, timestamp, target, cols_to_remove, model_type='RandomForest'):
+def make_dataset(path, timestamp, target, cols_to_remove, preprocessing=('one_hot', 'impute')):
 
     """
         Function to create the dataset used for model training.
@@ -17,7 +17,8 @@ def make_dataset(path, timestamp, target, cols_to_remove, model_type='RandomFore
            target (str):  Dependent variable to use.
 
         Kwargs:
-           model_type (str): Type of model used.
+           preprocessing (list): Data preparation stages needed by the model
+           ('one_hot', 'impute', 'scale').
 
         Returns:
            DataFrame, DataFrame. Train and test datasets for the model.
@@ -28,11 +29,12 @@ def make_dataset(path, timestamp, target, cols_to_remove, model_type='RandomFore
     print('---> Train / test split')
     train_df, test_df = train_test_split(df, test_size=0.2, random_state=50)
     print('---> Transforming data')
-    train_df, test_df = transform_data(train_df, test_df, timestamp, target, cols_to_remove)
+    train_df, test_df = transform_data(train_df, test_df, timestamp, target, cols_to_remove,
+                                       one_hot='one_hot' in preprocessing)
     print('---> Feature engineering')
     train_df, test_df = feature_engineering(train_df, test_df)
     print('---> Preparing data for training')
-    train_df, test_df = pre_train_data_prep(train_df, test_df, model_type, timestamp, target)
+    train_df, test_df = pre_train_data_prep(train_df, test_df, preprocessing, timestamp, target)
 
     return train_df.copy(), test_df.copy()
 
@@ -53,7 +55,7 @@ def get_raw_data_from_local(path):
     return df.copy()
 
 
-def transform_data(train_df, test_df, timestamp, target, cols_to_remove):
+def transform_data(train_df, test_df, timestamp, target, cols_to_remove, one_hot=True):
 
     """
         Function that allows performing the first transformation tasks
@@ -66,6 +68,9 @@ def transform_data(train_df, test_df, timestamp, target, cols_to_remove):
            target (str):  Dependent variable to use.
            cols_to_remove (list): Columns to remove.
 
+        Kwargs:
+           one_hot (bool): Generate dummies of the categorical variables.
+
         Returns:
            DataFrame, DataFrame. Train and test datasets for the model.
     """
@@ -91,16 +96,18 @@ def transform_data(train_df, test_df, timestamp, target, cols_to_remove):
     train_df.drop(columns=[target], inplace=True)
     test_df.drop(columns=[target], inplace=True)
 
-    # Generation of dummies
-    print('------> Encoding data')
-    train_df = pd.get_dummies(train_df)
-    test_df = pd.get_dummies(test_df)
-    # alineación de train y test para tener las mismas columnas
-    train_df, test_df = train_df.align(test_df, join='inner', axis=1)
+    # Generation of dummies (only for models without native categorical support)
+    if one_hot:
+        print('------> Encoding data')
+        train_df = pd.get_dummies(train_df)
+        test_df = pd.get_dummies(test_df)
+        # alineación de train y test para tener las mismas columnas
+        train_df, test_df = train_df.align(test_df, join='inner', axis=1)
 
     # Saving the resulting columns to IBM COS
     print('---------> Saving encoded columns')
-    cos.save_object_in_cos(train_df.columns, 'encoded_columns', timestamp)
+    if not cos.save_object_in_cos(train_df.columns, 'encoded_columns', timestamp):
+        raise RuntimeError('Unable to save the encoded columns in IBM COS')
 
     #"we rejoin the target variable to the datasets
     train_df.reset_index(drop=True, inplace=True)
@@ -113,7 +120,7 @@ def transform_data(train_df, test_df, timestamp, target, cols_to_remove):
     return train_df.copy(), test_df.copy()
 
 
-def pre_train_data_prep(train_df, test_df, model_type, timestamp, target):
+def pre_train_data_prep(train_df, test_df, preprocessing, timestamp, target):
     """
        Function that performs the last transformations on the data
        before training (null imputation and scaling)
@@ -121,7 +128,7 @@ def pre_train_data_prep(train_df, test_df, model_type, timestamp, target):
         Args:
            train_df (DataFrame):  Train dataset.
            test_df (DataFrame):  Test dataset.
-           model_type (str):  Type of model used.
+           preprocessing (list):  Data preparation stages needed by the model.
            timestamp (float):  Temporary representation in seconds.
            target (str):  Dependent variable to use.
 
@@ -136,11 +143,12 @@ def pre_train_data_prep(train_df, test_df, model_type, timestamp, target):
     test_df.drop(columns=[target], inplace=True)
 
     # imputación de nulos
-    print('------> Inputing missing values')
-    train_df, test_df = input_missing_values(train_df, test_df, timestamp)
+    if 'impute' in preprocessing:
+        print('------> Inputing missing values')
+        train_df, test_df = input_missing_values(train_df, test_df, timestamp)
 
     # restringimos el escalado solo a ciertos modelos
-    if model_type.upper() in ['SVM', 'KNN', 'NaiveBayes']:
+    if 'scale' in preprocessing:
         print('------> Scaling features')
         train_df, test_df = scale_data(train_df, test_df)
 
@@ -177,7 +185,8 @@ def input_missing_values(train_df, test_df, timestamp):
 
     # we save the imputator for future new data
     print('------> Saving imputer on the cloud')
-    cos.save_object_in_cos(imputer, 'imputer', timestamp)
+    if not cos.save_object_in_cos(imputer, 'imputer', timestamp):
+        raise RuntimeError('Unable to save the imputer in IBM COS')
 
     return train_df.copy(), test_df.copy()
 
@@ -223,9 +232,9 @@ def scale_data(train_df, test_df):
     # scaling object in range (0,1)
     scaler = MinMaxScaler(feature_range=(0, 1))
     # fit and transform on train data
-    train_df = scaler.fit_transform(train_df)
+    train_df = pd.DataFrame(scaler.fit_transform(train_df), columns=train_df.columns)
     # test data scaling
-    test_df = scaler.transform(test_df)
+    test_df = pd.DataFrame(scaler.transform(test_df), columns=test_df.columns)
 
     return train_df.copy(), test_df.copy()
 
@@ -1,9 +1,19 @@
 from sklearn.metrics import confusion_matrix, accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
+from concurrent.futures import ProcessPoolExecutor
+from ..utils.utils import get_worker_context
+import numpy as np
 import pandas as pd
 from datetime import datetime
+import os
 
+# data shared with the processes of the permutation pool
+_worker_data = {}
+# minimum work (rows predicted in all the permutations) to use a process pool
+POOL_MIN_PREDICTED_ROWS = 1000000
 
-def evaluate_model(model, X_test, y_test, timestamp, model_name):
+
+def evaluate_model(model, X_test, y_test, timestamp, model_name,
+                   n_repeats=5, max_rows=10000, n_jobs=-1):
     """
         This function allows you to perform an evaluation of the trained model
         and create a dictionary with all the relevant information about it
@@ -15,22 +25,31 @@ def evaluate_model(model, X_test, y_test, timestamp, model_name):
            timestamp (float):  Temporary representation in seconds.
            model_name (str):  Model name
 
+        Kwargs:
+           n_repeats (int):  Permutations of each variable.
+           max_rows (int):  Maximum test rows used in the permutations.
+           n_jobs (int):  Processes used in the permutations.
+
         Returns:
            dict. Dictionary with model info
     """
 
     # get predictions using the trained model
     y_pred = model.predict(X_test)
+    y_proba = model.predict_proba(X_test)[:, 1]
 
-    # extract the importance of variables
-    feature_importance_values = model.feature_importances_
+    # extract the importance of variables (not available in every model)
+    feature_importance_values = getattr(model, 'feature_importances_', None)
 
     # Variable names
     features = list(X_test.columns)
-    
+
+    # importance of variables measured by permutation in test
+    perm_importances = get_permutation_importances(model, X_test, y_test, y_proba,
+                                                   n_repeats, max_rows, n_jobs)
+
     # creation of the model info dictionary
     model_info = {}
-    #fi_df = pd.DataFrame({'feature': features, 'importance': feature_importance_values})
 
     # model overview
     model_info['_id'] = 'model_' + str(int(timestamp))
@@ -44,17 +63,127 @@ def evaluate_model(model, X_test, y_test, timestamp, model_name):
     model_info['objects']['imputer'] = 'imputer_' + str(int(timestamp))
     # used metrics
     model_info['model_metrics'] = {}
-    # model_info['model_metrics']['feature_importances'] = dict(zip(fi_df.area, fi_df.importance))
+    if feature_importance_values is not None:
+        fi_df = pd.DataFrame({'feature': features, 'importance': feature_importance_values})
+        model_info['model_metrics']['feature_importances'] = dict(zip(fi_df.feature, fi_df.importance.astype(float)))
+    model_info['model_metrics']['permutation_importances'] = perm_importances
     model_info['model_metrics']['confusion_matrix'] = confusion_matrix(y_test, y_pred).tolist()
     model_info['model_metrics']['accuracy_score'] = accuracy_score(y_test, y_pred)
     model_info['model_metrics']['precision_score'] = precision_score(y_test, y_pred)
     model_info['model_metrics']['recall_score'] = recall_score(y_test, y_pred)
     model_info['model_metrics']['f1_score'] = f1_score(y_test, y_pred)
-    model_info['model_metrics']['roc_auc_score'] = roc_auc_score(y_test, model.predict_proba(X_test)[:, 1])
+    model_info['model_metrics']['roc_auc_score'] = roc_auc_score(y_test, y_proba)
     # model status (in production or not)
     model_info['status'] = "none"
 
     return model_info
 
 
+def get_permutation_importances(model, X_test, y_test, y_proba, n_repeats=5, max_rows=10000,
+                                n_jobs=-1, random_state=50):
+    """
+        Function to compute the permutation importance of the variables
+        (decrease of the AUC score when a variable is shuffled). The
+        permutations are computed in batches across a process pool.
+
+        Args:
+           model (sklearn-object):  Trained model object.
+           X_test (DataFrame): Independent variables in test.
+           y_test (Series):  Dependent variable in test.
+           y_proba (array):  Baseline probabilities predicted in test.
+
+        Kwargs:
+           n_repeats (int):  Permutations of each variable.
+           max_rows (int):  Maximum test rows used in the permutations.
+           n_jobs (int):  Processes used in the permutations.
+           random_state (int):  Seed of the permutations.
+
+        Returns:
+           dict. Mean and standard deviation of the importance of each variable.
+    """
+    rng = np.random.RandomState(random_state)
+    y_test = np.asarray(y_test)
+
+    # the cost is bounded using a sample of the test rows
+    if len(X_test) > max_rows:
+        rows = rng.choice(len(X_test), max_rows, replace=False)
+        X_test, y_test, y_proba = X_test.iloc[rows], y_test[rows], y_proba[rows]
+
+    # the baseline prediction is reused for all the permutations
+    baseline_score = roc_auc_score(y_test, y_proba)
+
+    # one task for each variable and repeat, with its own seed
+    seeds = rng.randint(np.iinfo(np.int32).max, size=(X_test.shape[1], n_repeats))
+    tasks = [(col, seeds[col, i]) for col in range(X_test.shape[1]) for i in range(n_repeats)]
+
+    n_workers = min(os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs, len(tasks))
+    # small holdouts are permuted in-process, the pool startup costs more than the work
+    if n_workers <= 1 or len(tasks) * len(X_test) < POOL_MIN_PREDICTED_ROWS:
+        data = {'model': model, 'X_test': X_test, 'y_test': y_test, 'baseline_score': baseline_score}
+        results = permute_batch(tasks, data)
+    else:
+        # tasks are grouped in batches to limit the communication between processes
+        batches = [batch for batch in np.array_split(np.array(tasks), n_workers * 2) if len(batch)]
+        # forkserver workers, with the app modules (and connections) preloaded once
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_worker_context(),
+                                 initializer=init_permutation_worker,
+                                 initargs=(model, X_test, y_test, baseline_score)) as executor:
+            results = [res for batch_res in executor.map(permute_batch, batches) for res in batch_res]
+
+    # score decrease of each variable and repeat
+    decreases = np.zeros((X_test.shape[1], n_repeats))
+    repeats = np.zeros(X_test.shape[1], dtype=int)
+    for col, decrease in results:
+        decreases[col, repeats[col]] = decrease
+        repeats[col] += 1
+
+    return {feature: {'mean': float(decreases[i].mean()), 'std': float(decreases[i].std())}
+            for i, feature in enumerate(X_test.columns)}
+
+
+def init_permutation_worker(model, X_test, y_test, baseline_score):
+    """
+        Function to load the data shared by the permutation tasks.
+
+        Args:
+           model (sklearn-object):  Trained model object.
+           X_test (DataFrame): Independent variables in test.
+           y_test (array):  Dependent variable in test.
+           baseline_score (float):  AUC score without permutations.
+    """
+    # each process predicts with a single core to avoid oversubscription
+    if hasattr(model, 'n_jobs'):
+        model.n_jobs = 1
+    _worker_data['model'] = model
+    _worker_data['X_test'] = X_test
+    _worker_data['y_test'] = y_test
+    _worker_data['baseline_score'] = baseline_score
+
+
+def permute_batch(tasks, data=None):
+    """
+        Function to compute a batch of permutations.
+
+        Args:
+           tasks (list):  Pairs of variable position and seed.
+
+        Kwargs:
+           data (dict):  Model and test data (by default, the data
+           loaded in the pool process).
+
+        Returns:
+           list. Pairs of variable position and score decrease.
+    """
+    data = _worker_data if data is None else data
+    model = data['model']
+    X_perm = data['X_test'].copy()
+    results = []
+    for col, seed in tasks:
+        # the variable is shuffled and restored after scoring
+        original = X_perm.iloc[:, col].to_numpy(copy=True)
+        X_perm.iloc[:, col] = np.random.RandomState(seed).permutation(original)
+        score = roc_auc_score(data['y_test'], model.predict_proba(X_perm)[:, 1])
+        X_perm.iloc[:, col] = original
+        results.append((int(col), data['baseline_score'] - score))
 
+    return results
@@ -29,6 +29,8 @@ def create_domain_knowledge_features(df):
     # creación de variable Child de tipo booleana
     df['Sex_child'] = 0
     df.loc[df.Age < 16, 'Sex_child'] = 1
-    df.loc[df.Age < 16, 'Sex_male'] = 0
-    df.loc[df.Age < 16, 'Sex_female'] = 0
+    # the sex dummies only exist when the data has been one-hot encoded
+    for col in ['Sex_male', 'Sex_female']:
+        if col in df.columns:
+            df.loc[df.Age < 16, col] = 0
     return df.copy()
\ No newline at end of file
@@ -0,0 +1,115 @@
+from app import cos, client
+from cloudant.query import Query
+import time
+import os
+
+
+def build_artifacts_manifest(model_info, bucket_name='deposittitanic'):
+    """
+        Function to build the manifest of the artifacts of a model
+        (keys, sizes and formats), stored with the model info.
+
+        Args:
+            model_info (dict):  Model info.
+
+        Kwargs:
+            bucket_name (str):  IBM COS repository used.
+
+        Returns:
+            list. Artifacts of the model.
+    """
+    manifest = []
+    for key in get_artifact_keys(model_info):
+        manifest.append({'key': key,
+                         'size': cos.get_object_size(key, bucket_name),
+                         'format': 'pickle'})
+
+    return manifest
+
+
+def get_artifact_keys(model_info):
+    """
+        Function to get the IBM COS keys of the artifacts of a model.
+        Models saved without manifest use the naming convention.
+
+        Args:
+            model_info (dict):  Model info.
+
+        Returns:
+            list. Keys of the artifacts.
+    """
+    if 'artifacts' in model_info:
+        return [artifact['key'] for artifact in model_info['artifacts']]
+
+    names = [model_info['_id']] + list(model_info.get('objects', {}).values())
+    return [name + '.pkl' for name in names]
+
+
+def collect_artifacts_garbage(db_name, retention_count=None, retention_days=None,
+                              checkpoint_dir=None, bucket_name='deposittitanic'):
+    """
+        Function to delete the artifacts of the models that are not in
+        production, beyond the most recent ones or older than the age limit.
+        It must run holding the promotion lock of the training pipeline.
+
+        Args:
+            db_name (str):  Database name.
+
+        Kwargs:
+            retention_count (int):  Models (not in production) whose artifacts are kept.
+            retention_days (float):  Maximum age of the artifacts kept.
+            checkpoint_dir (str):  Directory of the training checkpoints. The
+            models of runs with a checkpoint (not finished yet) are kept.
+            bucket_name (str):  IBM COS repository used.
+
+        Returns:
+            list. Ids of the models whose artifacts have been deleted.
+    """
+    if retention_count is None and retention_days is None:
+        print('------> No retention settings, nothing to delete')
+        return []
+
+    # the registry is used as index, so the bucket is never listed
+    db = client.get_database(db_name)
+    query = Query(db, selector={'_id': {'$regex': '^model_'}, 'status': {'$ne': 'in_production'}})
+    docs = [doc for doc in query.result if not doc.get('artifacts_deleted', False)]
+    # models of unfinished runs, they can still be promoted when the run is resumed
+    if checkpoint_dir is not None:
+        docs = [doc for doc in docs
+                if not os.path.isdir(os.path.join(checkpoint_dir, doc['_id'].split('_')[1]))]
+    # most recent models first (the id includes the training timestamp)
+    docs.sort(key=lambda doc: int(doc['_id'].split('_')[1]), reverse=True)
+
+    now = time.time()
+    expired = []
+    for i, doc in enumerate(docs):
+        age_days = (now - int(doc['_id'].split('_')[1])) / 86400
+        if (retention_count is not None and i >= retention_count) or \
+                (retention_days is not None and age_days > retention_days):
+            expired.append(doc)
+
+    if not expired:
+        print('------> No expired artifacts')
+        return []
+
+    # the status is read again right before deleting, a model may have been promoted
+    expired_docs = []
+    for doc in expired:
+        model_doc = db[doc['_id']]
+        model_doc.fetch()
+        if model_doc.get('status') != 'in_production':
+            expired_docs.append(model_doc)
+
+    keys = [key for doc in expired_docs for key in get_artifact_keys(doc)]
+    print('------> Deleting {} artifacts of {} models'.format(len(keys), len(expired_docs)))
+    failed_keys = set(cos.delete_objects_in_cos(keys, bucket_name))
+
+    # the models whose artifacts have all been deleted are marked in the registry
+    deleted_ids = []
+    for model_doc in expired_docs:
+        if failed_keys.isdisjoint(get_artifact_keys(model_doc)):
+            model_doc['artifacts_deleted'] = True
+            model_doc.save()
+            deleted_ids.append(model_doc['_id'])
+
+    return deleted_ids
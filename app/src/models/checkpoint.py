@@ -0,0 +1,157 @@
+import pickle
+import shutil
+import json
+import time
+import os
+
+
+class TrainingCheckpoint:
+    """
+        Class to manage the checkpoints of the training pipeline stages
+    """
+
+    def __init__(self, timestamp, checkpoint_dir, info=None):
+        """
+            Checkpoint builder. The state of a previous run with the same
+            timestamp is loaded if it exists.
+
+            Args:
+               timestamp (float): Temporary representation in seconds.
+               checkpoint_dir (str): Directory of the checkpoints.
+
+            Kwargs:
+               info (dict): Run info to store (data path, settings, etc.).
+               It is only given by new runs, which fail if another run
+               already has a checkpoint with the same timestamp.
+        """
+        self.run_dir = os.path.join(checkpoint_dir, str(int(timestamp)))
+        self.state_path = os.path.join(self.run_dir, 'state.json')
+
+        if info is not None:
+            # the directory is created here, so two new runs can never share it
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            try:
+                os.mkdir(self.run_dir)
+            except FileExistsError:
+                raise FileExistsError('There is already a checkpoint of the training run {}, '
+                                      'try again in a few seconds'.format(int(timestamp)))
+
+        if os.path.isfile(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+        else:
+            self.state = {'timestamp': timestamp, 'info': info or {}, 'completed': []}
+        # original timestamp of the run (the one given may be truncated on resume)
+        self.timestamp = self.state['timestamp']
+
+    def exists(self):
+        """
+            Function to check if the run has a saved state.
+
+            Returns:
+               boolean. Exist or not of the state.
+        """
+        return os.path.isfile(self.state_path)
+
+    @property
+    def info(self):
+        """
+            Run info.
+        """
+        return self.state['info']
+
+    def is_completed(self, stage):
+        """
+            Function to check if a stage has been completed.
+
+            Args:
+               stage (str):  Stage name.
+
+            Returns:
+               boolean. Stage completed or not.
+        """
+        return stage in self.state['completed']
+
+    def save_state(self):
+        """
+            Function to write the state of the run.
+        """
+        os.makedirs(self.run_dir, exist_ok=True)
+        write_atomic(self.state_path, json.dumps(self.state).encode())
+
+    def save(self, stage, obj=None):
+        """
+            Function to mark a stage as completed, saving its output.
+
+            Args:
+               stage (str):  Stage name.
+
+            Kwargs:
+               obj:  Output of the stage to reuse on resume.
+        """
+        os.makedirs(self.run_dir, exist_ok=True)
+        if obj is not None:
+            write_atomic(os.path.join(self.run_dir, stage + '.pkl'), pickle.dumps(obj))
+        if stage not in self.state['completed']:
+            self.state['completed'].append(stage)
+        self.save_state()
+
+    def load(self, stage):
+        """
+            Function to load the output of a completed stage.
+
+            Args:
+               stage (str):  Stage name.
+
+            Returns:
+               obj. Output of the stage.
+        """
+        with open(os.path.join(self.run_dir, stage + '.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+    def clear(self):
+        """
+            Function to remove the checkpoints of the run.
+        """
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+
+def write_atomic(path, data):
+    """
+        Function to write a file, replacing it only once it is complete.
+
+        Args:
+           path (str):  File path.
+           data (bytes):  Content to write.
+    """
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def clear_old_checkpoints(checkpoint_dir, max_age_days):
+    """
+        Function to remove the checkpoints of the runs that have not
+        been resumed, older than the age limit.
+
+        Args:
+           checkpoint_dir (str):  Directory of the checkpoints.
+           max_age_days (float):  Maximum age of the checkpoints kept.
+
+        Returns:
+           list. Timestamps of the removed runs.
+    """
+    if not os.path.isdir(checkpoint_dir):
+        return []
+
+    removed = []
+    now = time.time()
+    for name in os.listdir(checkpoint_dir):
+        # the directory of each run is named after its timestamp
+        if not name.isdigit():
+            continue
+        if (now - int(name)) / 86400 > max_age_days:
+            shutil.rmtree(os.path.join(checkpoint_dir, name), ignore_errors=True)
+            removed.append(int(name))
+
+    return removed
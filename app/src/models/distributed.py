@@ -0,0 +1,332 @@
+from sklearn.ensemble import RandomForestClassifier
+from ..utils.utils import get_worker_context
+import numpy as np
+import tempfile
+import pickle
+import shutil
+import socket
+import glob
+import json
+import time
+import sys
+import os
+
+# extensions of the task files, pending and claimed by a worker
+TASK_SUFFIX = '.json'
+CLAIMED_SUFFIX = '.claimed'
+
+
+def train_distributed_forest(X_train, y_train, model_config, n_workers, queue_dir=None,
+                             n_jobs=1, random_state=50, timeout=None, poll_interval=0.5):
+    """
+        Function to train a Random Forest splitting its trees between
+        several workers. The tasks are published in a filesystem queue,
+        so workers on other hosts sharing the queue directory can also
+        take them (see worker_loop).
+
+        Args:
+            X_train (DataFrame):  Independent variables in train.
+            y_train (Series):  Dependent variable in train.
+            model_config (dict):  Training settings.
+            n_workers (int):  Number of tasks.
+
+        Kwargs:
+            queue_dir (str):  Directory of the queue (shared by the hosts).
+            n_jobs (int):  Cores available for the local workers. One
+            single-core worker is started per core, and the tasks left
+            stay in the queue for the next free worker.
+            random_state (int):  Seed used to generate the seeds of the tasks.
+            timeout (float):  Maximum seconds waiting for the workers.
+            poll_interval (float):  Seconds between queue checks.
+
+        Returns:
+            sklearn-object. Trained Random Forest with the merged trees.
+    """
+    if queue_dir is not None:
+        os.makedirs(queue_dir, exist_ok=True)
+    run_dir = tempfile.mkdtemp(prefix='forest_', dir=queue_dir)
+    workers = []
+
+    try:
+        # the training data is shared by the workers as memory-mapped files
+        X_path = os.path.join(run_dir, 'X.npy')
+        y_path = os.path.join(run_dir, 'y.npy')
+        np.save(X_path, np.ascontiguousarray(X_train, dtype=np.float32))
+        np.save(y_path, np.asarray(y_train))
+
+        # trees of each task, with distinct seeds
+        n_tasks = max(1, min(n_workers, model_config['n_estimators']))
+        n_trees = np.array_split(np.arange(model_config['n_estimators']), n_tasks)
+        seeds = np.random.RandomState(random_state).randint(np.iinfo(np.int32).max, size=n_tasks)
+        results = []
+        for i in range(n_tasks):
+            result_path = os.path.join(run_dir, 'result_{}.pkl'.format(i))
+            task = {'X': X_path, 'y': y_path, 'result': result_path,
+                    'n_estimators': len(n_trees[i]), 'max_features': model_config['max_features'],
+                    'seed': int(seeds[i])}
+            publish_task(os.path.join(run_dir, 'task_{}.json'.format(i)), task)
+            results.append(result_path)
+
+        # local workers, only for the tasks of this run and within the cores given
+        n_local = min(n_tasks, n_jobs if n_jobs > 0 else os.cpu_count() or 1)
+        context = get_worker_context()
+        workers = [context.Process(target=worker_loop, args=(run_dir,),
+                                   kwargs={'n_jobs': 1, 'pattern': 'task_*.json'})
+                   for _ in range(n_local)]
+        for worker in workers:
+            worker.start()
+
+        # waiting for the results of all the tasks
+        start = time.time()
+        while not all(os.path.exists(path) for path in results):
+            if timeout is not None and time.time() - start > timeout:
+                # tasks claimed by workers that never finished them, and tasks never claimed
+                claimed = [os.path.basename(path) for path in glob.glob(os.path.join(run_dir, 'task_*' + CLAIMED_SUFFIX))]
+                pending = [os.path.basename(path) for path in glob.glob(os.path.join(run_dir, 'task_*.json'))]
+                raise TimeoutError('Distributed training did not finish in {} seconds. '
+                                   'Unfinished claimed tasks: {}. Pending tasks: {}'.format(timeout, claimed, pending))
+            if any(worker.exitcode not in (None, 0) for worker in workers):
+                raise RuntimeError('A local training worker failed')
+            time.sleep(poll_interval)
+
+        for worker in workers:
+            worker.join()
+
+        forests = []
+        for path in results:
+            with open(path, 'rb') as f:
+                forests.append(pickle.load(f))
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    model = merge_forests(forests)
+    # the trees have been trained without the variable names
+    if hasattr(X_train, 'columns') and hasattr(model, 'n_features_in_'):
+        model.feature_names_in_ = np.asarray(X_train.columns, dtype=object)
+    model.n_jobs = 1
+
+    return model
+
+
+def merge_forests(forests):
+    """
+        Function to merge the trees of several Random Forests.
+
+        Args:
+            forests (list):  Trained Random Forests.
+
+        Returns:
+            sklearn-object. Random Forest with all the trees.
+    """
+    model = forests[0]
+    for forest in forests[1:]:
+        model.estimators_ += forest.estimators_
+    model.n_estimators = len(model.estimators_)
+
+    return model
+
+
+def get_claimed_path(path):
+    """
+        Function to get the path of a task claimed by this process:
+        task_<i>.json.<host>-<pid>.claimed
+
+        Args:
+            path (str):  Task path.
+
+        Returns:
+            str. Path of the claimed task.
+    """
+    return '{}.{}-{}{}'.format(path, socket.gethostname(), os.getpid(), CLAIMED_SUFFIX)
+
+
+def parse_claimed_path(claimed_path):
+    """
+        Function to get the task path and the worker of a claimed task.
+        The host name may contain dots, so the path is split on the
+        task extension instead of the last dots.
+
+        Args:
+            claimed_path (str):  Path of the claimed task.
+
+        Returns:
+            str, str, int. Task path, host and process id of the worker.
+    """
+    path, worker = claimed_path[:-len(CLAIMED_SUFFIX)].rsplit(TASK_SUFFIX + '.', 1)
+    host, pid = worker.rsplit('-', 1)
+
+    return path + TASK_SUFFIX, host, int(pid)
+
+
+def is_worker_alive(host, pid):
+    """
+        Function to check if a worker of this host is still running.
+
+        Args:
+            host (str):  Host of the worker.
+            pid (int):  Process id of the worker.
+
+        Returns:
+            boolean. Worker alive or not, None for workers of other hosts.
+    """
+    if host != socket.gethostname():
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists but belongs to another user
+        return True
+
+    return True
+
+
+def publish_task(path, task):
+    """
+        Function to publish a task in the queue. The file is renamed
+        once written, so workers never read partial tasks.
+
+        Args:
+            path (str):  Task path.
+            task (dict):  Task info.
+    """
+    with open(path + '.tmp', 'w') as f:
+        json.dump(task, f)
+    os.rename(path + '.tmp', path)
+
+
+def claim_task(queue_dir, pattern):
+    """
+        Function to claim a pending task of the queue. The rename of
+        the file is atomic, so only one worker gets each task. The claimed
+        file (named after the host and process) is kept until the result
+        is written, so unfinished tasks can be found and re-queued.
+
+        Args:
+            queue_dir (str):  Directory of the queue.
+            pattern (str):  Pattern of the task files.
+
+        Returns:
+            dict. Task info, None if there are no pending tasks.
+    """
+    for path in sorted(glob.glob(os.path.join(queue_dir, pattern))):
+        claimed_path = get_claimed_path(path)
+        try:
+            os.rename(path, claimed_path)
+        except OSError:
+            # the task has been taken by another worker
+            continue
+        # the modification time of the claimed file is the start of its lease
+        os.utime(claimed_path)
+        with open(claimed_path) as f:
+            task = json.load(f)
+        task['claimed'] = claimed_path
+        return task
+
+    return None
+
+
+def run_task(task, n_jobs=1):
+    """
+        Function to train the trees of a task and to save them.
+
+        Args:
+            task (dict):  Task info.
+
+        Kwargs:
+            n_jobs (int):  Cores used to fit the trees.
+    """
+    X = np.load(task['X'], mmap_mode='r')
+    y = np.load(task['y'], mmap_mode='r')
+    forest = RandomForestClassifier(n_estimators=task['n_estimators'],
+                                    max_features=task['max_features'],
+                                    random_state=task['seed'],
+                                    n_jobs=n_jobs)
+    forest.fit(X, y)
+
+    with open(task['result'] + '.tmp', 'wb') as f:
+        pickle.dump(forest, f)
+    os.rename(task['result'] + '.tmp', task['result'])
+    # the task is finished once its result exists (the claimed file may
+    # have been re-queued and finished by another worker meanwhile)
+    try:
+        os.remove(task['claimed'])
+    except FileNotFoundError:
+        pass
+
+
+def worker_loop(queue_dir, n_jobs=1, pattern='*/task_*.json', wait=False, poll_interval=0.5):
+    """
+        Function to run a training worker on the queue.
+
+        Args:
+            queue_dir (str):  Directory of the queue.
+
+        Kwargs:
+            n_jobs (int):  Cores used to fit the trees.
+            pattern (str):  Pattern of the task files.
+            wait (bool):  Keep waiting for new tasks when the queue is empty.
+            poll_interval (float):  Seconds between queue checks.
+    """
+    while True:
+        task = claim_task(queue_dir, pattern)
+        if task is not None:
+            print('------> Worker {} training {} trees'.format(os.getpid(), task['n_estimators']))
+            run_task(task, n_jobs)
+        elif wait:
+            time.sleep(poll_interval)
+        else:
+            break
+
+
+def requeue_claimed_tasks(queue_dir, pattern='*/task_*' + CLAIMED_SUFFIX, lease=3600):
+    """
+        Function to put back in the queue the tasks claimed by workers
+        that died before writing their result. The workers of this host
+        are checked, the tasks of other hosts are re-queued once their
+        lease expires.
+
+        Args:
+            queue_dir (str):  Directory of the queue.
+
+        Kwargs:
+            pattern (str):  Pattern of the claimed task files.
+            lease (float):  Seconds a task of another host can be claimed.
+
+        Returns:
+            list. Paths of the re-queued tasks.
+    """
+    requeued = []
+    now = time.time()
+    for claimed_path in glob.glob(os.path.join(queue_dir, pattern)):
+        path, host, pid = parse_claimed_path(claimed_path)
+        alive = is_worker_alive(host, pid)
+        try:
+            expired = now - os.path.getmtime(claimed_path) > lease
+        except OSError:
+            # the task has been finished or re-queued meanwhile
+            continue
+        if alive or (alive is None and not expired):
+            continue
+        try:
+            os.rename(claimed_path, path)
+        except OSError:
+            # the task has been finished or re-queued meanwhile
+            continue
+        requeued.append(path)
+
+    return requeued
+
+
+# remote workers: python -m app.src.models.distributed <queue_dir> [n_jobs]
+# orphaned tasks: python -m app.src.models.distributed requeue <queue_dir> [lease]
+if __name__ == '__main__':
+    if sys.argv[1] == 'requeue':
+        lease = float(sys.argv[3]) if len(sys.argv) > 3 else 3600
+        print('------> Re-queued tasks: {}'.format(requeue_claimed_tasks(sys.argv[2], lease=lease)))
+    else:
+        worker_loop(sys.argv[1], n_jobs=int(sys.argv[2]) if len(sys.argv) > 2 else 1, wait=True)
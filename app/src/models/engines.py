@@ -0,0 +1,122 @@
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import OrdinalEncoder
+import numpy as np
+try:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+except ImportError:
+    # scikit-learn < 1.0 keeps the estimator as experimental
+    from sklearn.experimental import enable_hist_gradient_boosting  # noqa: F401
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+
+def build_random_forest(model_config, X_train, n_jobs=-1):
+    """
+        Function to build a Random Forest.
+
+        Args:
+            model_config (dict):  Training settings.
+            X_train (DataFrame):  Independent variables in train.
+
+        Kwargs:
+            n_jobs (int):  Cores used to fit the model.
+
+        Returns:
+            sklearn-object. Model to fit.
+    """
+    return RandomForestClassifier(n_estimators=model_config['n_estimators'],
+                                  max_features=model_config['max_features'],
+                                  random_state=50,
+                                  n_jobs=n_jobs)
+
+
+def build_hist_gradient_boosting(model_config, X_train, n_jobs=-1):
+    """
+        Function to build a Histogram Gradient Boosting. The missing
+        values are handled by the estimator and the categorical variables
+        are only mapped to integer codes, so the data needs no imputation
+        or one-hot encoding.
+
+        Args:
+            model_config (dict):  Training settings.
+            X_train (DataFrame):  Independent variables in train.
+
+        Kwargs:
+            n_jobs (int):  Not used, the OpenMP threads of the estimator
+            are limited when the model is fitted.
+
+        Returns:
+            sklearn-object. Model to fit.
+    """
+    cat_cols = list(X_train.select_dtypes(exclude='number').columns)
+    num_cols = [col for col in X_train.columns if col not in cat_cols]
+
+    # categories to integer codes (unknown categories are treated as missing values)
+    encoder = ColumnTransformer([
+        ('categorical', make_pipeline(SimpleImputer(strategy='constant', fill_value='__missing__'),
+                                      OrdinalEncoder(handle_unknown='use_encoded_value',
+                                                     unknown_value=np.nan)), cat_cols),
+        ('numeric', 'passthrough', num_cols)
+    ])
+    model = HistGradientBoostingClassifier(max_iter=model_config.get('max_iter', 100),
+                                           learning_rate=model_config.get('learning_rate', 0.1),
+                                           max_leaf_nodes=model_config.get('max_leaf_nodes', 31),
+                                           categorical_features=[True] * len(cat_cols) + [False] * len(num_cols),
+                                           random_state=50)
+
+    return make_pipeline(encoder, model)
+
+
+# estimators available for training, the data preparation stages they need
+# ('one_hot': dummy encoding, 'impute': null imputation, 'scale': scaling)
+# and the settings used as hyperparameters
+ENGINES = {
+    'RandomForest': {'build': build_random_forest,
+                     'preprocessing': ['one_hot', 'impute'],
+                     'params': ['n_estimators', 'max_features']},
+    'HistGradientBoosting': {'build': build_hist_gradient_boosting,
+                             'preprocessing': [],
+                             'params': ['max_iter', 'learning_rate', 'max_leaf_nodes']}
+}
+
+
+def get_engine(model_config):
+    """
+        Function to get the engine chosen in the training settings.
+
+        Args:
+            model_config (dict):  Training settings.
+
+        Returns:
+            str, dict. Engine name and engine.
+    """
+    name = model_config.get('engine', 'RandomForest')
+    if name not in ENGINES:
+        raise ValueError('Unknown engine {}. Available engines: {}'.format(name, list(ENGINES)))
+
+    return name, ENGINES[name]
+
+
+def get_training_settings(model_config):
+    """
+        Function to get the settings the trained model depends on
+        (engine, hyperparameters and data used), leaving out the
+        operational ones (retention, timeouts, drift threshold, etc.).
+
+        Args:
+            model_config (dict):  Training settings.
+
+        Returns:
+            dict. Settings that define the model.
+    """
+    # unknown engines are reported when the model is trained
+    name = model_config.get('engine', 'RandomForest')
+    params = ENGINES[name]['params'] if name in ENGINES else []
+    settings = {'engine': name,
+                'target': model_config.get('target'),
+                'cols_to_remove': model_config.get('cols_to_remove')}
+    settings.update({param: model_config.get(param) for param in params})
+
+    return settings
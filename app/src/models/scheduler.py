@@ -0,0 +1,93 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+
+
+class TrainingScheduler:
+    """
+        Class to coalesce the training requests and to limit
+        the CPU used by concurrent fits
+    """
+
+    def __init__(self, cpu_budget=None, cores_per_job=None):
+        """
+            Training scheduler builder
+
+            Kwargs:
+               cpu_budget (int): Total cores available for training jobs.
+               cores_per_job (int): Cores (n_jobs) given to each training job.
+        """
+        self.cpu_budget = max(1, cpu_budget or os.cpu_count() or 1)
+        self.cores_per_job = max(1, min(cores_per_job or self.cpu_budget, self.cpu_budget))
+        # number of jobs that can be fitted at the same time
+        self.max_concurrent_jobs = self.cpu_budget // self.cores_per_job
+        self._slots = threading.BoundedSemaphore(self.max_concurrent_jobs)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def run(self, fingerprint, fn, *args, **kwargs):
+        """
+            Function to run a training job. If an identical job is already
+            running, the call waits for it and returns its result.
+
+            Args:
+               fingerprint (str):  Job fingerprint.
+               fn (function):  Job to run. It must accept the n_jobs kwarg.
+
+            Returns:
+               obj. Output of the job.
+        """
+        with self._lock:
+            future = self._in_flight.get(fingerprint)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[fingerprint] = future
+
+        # identical request in flight: we attach to it
+        if not owner:
+            print('---> Attaching to the training job in flight {}'.format(fingerprint[:12]))
+            return future.result()
+
+        try:
+            # waiting for a free slot of the CPU budget
+            with self._slots:
+                result = fn(*args, n_jobs=self.cores_per_job, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._in_flight[fingerprint]
+
+        return result
+
+
+def get_request_fingerprint(path, config_doc, chunk_size=1 << 20):
+    """
+        Function to fingerprint a training request using
+        the data hash and the config revision.
+
+        Args:
+           path (str):  Data path.
+           config_doc (dict):  Document with model configuration.
+
+        Kwargs:
+           chunk_size (int):  Bytes read in each step.
+
+        Returns:
+           str. Request fingerprint.
+    """
+    data_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            data_hash.update(chunk)
+
+    fingerprint = hashlib.sha256()
+    fingerprint.update(data_hash.hexdigest().encode())
+    fingerprint.update(str(config_doc.get('_id')).encode())
+    fingerprint.update(str(config_doc.get('_rev')).encode())
+    return fingerprint.hexdigest()
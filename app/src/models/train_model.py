@@ -1,12 +1,43 @@
-from ..data.make_dataset import make_dataset
+from ..data.make_dataset import make_dataset, get_raw_data_from_local
+from ..data.drift import compute_data_profile, compute_drift
 from ..evaluation.evaluate_model import evaluate_model
+from .distributed import train_distributed_forest
+from .checkpoint import TrainingCheckpoint
+from .engines import get_engine, get_training_settings
+from .artifacts import build_artifacts_manifest
 from app import ROOT_DIR, cos, client
-from sklearn.ensemble import RandomForestClassifier
 from cloudant.query import Query
+from threadpoolctl import threadpool_limits
+from datetime import datetime
+import threading
 import time
+import os
 
+# lock to avoid races between concurrent promotions to production
+promotion_lock = threading.Lock()
+# local directory of the training checkpoints
+CHECKPOINT_DIR = os.path.join(ROOT_DIR, 'checkpoints')
 
-def training_pipeline(path, model_info_db_name='titanic_db'):
+
+class TrainingStageError(Exception):
+    """
+        Error raised when a stage of a training run fails
+    """
+
+    def __init__(self, timestamp, stage):
+        """
+            Error builder
+
+            Args:
+               timestamp (float): Timestamp of the run.
+               stage (str): Failed stage.
+        """
+        super().__init__('Training run {} failed in the stage {}'.format(int(timestamp), stage))
+        self.timestamp = timestamp
+        self.stage = stage
+
+
+def training_pipeline(path, model_info_db_name='titanic_db', model_config=None, n_jobs=-1):
     """
         Function to manage the complete training pipeline
         of the model.
@@ -17,10 +48,17 @@ def training_pipeline(path, model_info_db_name='titanic_db'):
         Kwargs:
             model_info_db_name (str):  database to store
             the model info.
+            model_config (dict):  Training settings. They are loaded
+            from the database if not given.
+            n_jobs (int):  Cores used to fit the model.
+
+        Returns:
+            dict. Model info.
     """
 
     # Loading training settings
-    model_config = load_model_config(model_info_db_name)['model_config']
+    if model_config is None:
+        model_config = load_model_config(model_info_db_name)['model_config']
     # Dependent variable to use
     target = model_config['target']
     # Columns to remove
@@ -29,49 +67,244 @@ def training_pipeline(path, model_info_db_name='titanic_db'):
     # timestamp used to version the model and objects
     ts = time.time()
 
-    # loading and transformation of train and test data
-    train_df, test_df = make_dataset(path, ts, target, cols_to_remove)
+    # profile of the incoming data, stored with the model info
+    print('---> Profiling data')
+    features_df = get_raw_data_from_local(path).drop(columns=cols_to_remove + [target])
+    data_profile = compute_data_profile(features_df)
+
+    # retraining is skipped if the data has not drifted from the production model data
+    if model_config.get('drift_threshold') is not None:
+        skip_info = check_data_drift(features_df, ts, model_config, model_info_db_name)
+        if skip_info is not None:
+            return skip_info
 
-    # split of independent and dependent variables
-    y_train = train_df[target]
-    X_train = train_df.drop(columns=[target]).copy()
-    y_test = test_df[target]
-    X_test = test_df.drop(columns=[target]).copy()
+    # checkpoint of the run, to resume it from the last completed stage
+    checkpoint = TrainingCheckpoint(ts, CHECKPOINT_DIR,
+                                    info={'path': path,
+                                          'model_info_db_name': model_info_db_name,
+                                          'model_config': model_config,
+                                          'data_profile': data_profile})
+    checkpoint.save_state()
 
-    # model definition (Random Forest)
-    model = RandomForestClassifier(n_estimators=model_config['n_estimators'],
-                                   max_features=model_config['max_features'],
-                                   random_state=50,
-                                   n_jobs=-1)
+    return run_training_stages(checkpoint, n_jobs)
+
+
+def resume_training_pipeline(timestamp, n_jobs=-1):
+    """
+        Function to resume a training run from its last
+        completed stage.
+
+        Args:
+            timestamp (float):  Timestamp of the run to resume.
+
+        Kwargs:
+            n_jobs (int):  Cores used to fit the model.
+
+        Returns:
+            dict. Model info.
+    """
+    checkpoint = TrainingCheckpoint(timestamp, CHECKPOINT_DIR)
+    if not checkpoint.exists():
+        raise ValueError('There is no checkpoint of the training run {}'.format(int(timestamp)))
+
+    print('---> Resuming training run {} after stages: {}'.format(int(timestamp), checkpoint.state['completed']))
+    return run_training_stages(checkpoint, n_jobs)
+
+
+def run_training_stages(checkpoint, n_jobs=-1):
+    """
+        Function to run the stages of the training pipeline that
+        are not completed in the checkpoint.
+
+        Args:
+            checkpoint (TrainingCheckpoint):  Checkpoint of the run.
+
+        Kwargs:
+            n_jobs (int):  Cores used to fit the model.
+
+        Returns:
+            dict. Model info.
+    """
+    ts = checkpoint.timestamp
+    path = checkpoint.info['path']
+    model_info_db_name = checkpoint.info['model_info_db_name']
+    model_config = checkpoint.info['model_config']
+    target = model_config['target']
+    stage = None
+
+    try:
+        # loading and transformation of train and test data
+        stage = 'dataset'
+        # estimator to train and data preparation stages it needs
+        engine_name, engine = get_engine(model_config)
+        if checkpoint.is_completed(stage):
+            train_df, test_df = checkpoint.load(stage)
+        else:
+            train_df, test_df = make_dataset(path, ts, target, model_config['cols_to_remove'],
+                                             preprocessing=engine['preprocessing'])
+            checkpoint.save(stage, (train_df, test_df))
+
+        # split of independent and dependent variables
+        y_train = train_df[target]
+        X_train = train_df.drop(columns=[target]).copy()
+        y_test = test_df[target]
+        X_test = test_df.drop(columns=[target]).copy()
+
+        stage = 'fit'
+        if checkpoint.is_completed(stage):
+            print('---> Loading the trained model from the checkpoint')
+            model = checkpoint.load(stage)
+        else:
+            model = fit_model(X_train, y_train, model_config, n_jobs)
+            checkpoint.save(stage, model)
+
+        # saving the modil in IBM COS
+        stage = 'upload'
+        if not checkpoint.is_completed(stage):
+            print('------> Saving the model {} object on the cloud'.format('model_'+str(int(ts))))
+            if not save_model(model, 'model',  ts):
+                raise RuntimeError('Unable to save the model in IBM COS')
+            checkpoint.save(stage)
+
+        # Evaluation of the model and collection of relevant information
+        stage = 'evaluation'
+        if checkpoint.is_completed(stage):
+            metrics_dict = checkpoint.load(stage)
+        else:
+            print('---> Evaluating the model')
+            metrics_dict = evaluate_model(model, X_test, y_test, ts, model_config['model_name'],
+                                          n_repeats=model_config.get('permutation_repeats', 5),
+                                          max_rows=model_config.get('permutation_max_rows', 10000),
+                                          n_jobs=n_jobs)
+            metrics_dict['engine'] = engine_name
+            metrics_dict['model_config'] = model_config
+            metrics_dict['data_profile'] = checkpoint.info['data_profile']
+            # models without imputation have no imputer object
+            if 'impute' not in engine['preprocessing']:
+                del metrics_dict['objects']['imputer']
+            checkpoint.save(stage, metrics_dict)
+
+        # Save the information of the model in the documentary database
+        stage = 'info_save'
+        if not checkpoint.is_completed(stage):
+            print('------> Saving the model information on the cloud')
+            # index of the artifacts of the model in COS
+            metrics_dict['artifacts'] = build_artifacts_manifest(metrics_dict)
+            if not save_model_info(model_info_db_name, metrics_dict):
+                raise RuntimeError('Unable to save the model info in IBM Cloudant')
+            print('------> Model info saved SUCCESSFULLY!!')
+            checkpoint.save(stage)
+
+        # Selection of the best model for production
+        stage = 'promotion'
+        if not checkpoint.is_completed(stage):
+            print('---> Putting best model in production')
+            with promotion_lock:
+                put_best_model_in_production(metrics_dict, model_info_db_name, checkpoint)
+            checkpoint.save(stage)
+    except Exception as e:
+        print('------> ERROR in the stage {} of the training run {}: {}'.format(stage, int(ts), e))
+        raise TrainingStageError(ts, stage) from e
+
+    # the run is complete, nothing left to resume
+    checkpoint.clear()
+
+    return metrics_dict
+
+
+def fit_model(X_train, y_train, model_config, n_jobs=-1):
+    """
+        Function to fit the model with the training data.
+
+        Args:
+            X_train (DataFrame):  Independent variables in train.
+            y_train (Series):  Dependent variable in train.
+            model_config (dict):  Training settings.
+
+        Kwargs:
+            n_jobs (int):  Cores used to fit the model.
 
+        Returns:
+            sklearn-object. Trained model object.
+    """
     print('---> Training a model with the following configuration:')
     print(model_config)
 
-    # Fitting the model with the training data
-    model.fit(X_train, y_train)
+    engine_name, engine = get_engine(model_config)
+    n_workers = model_config.get('distributed_workers', 0)
+    if n_workers > 0 and engine_name != 'RandomForest':
+        print('------> Distributed training is only available for RandomForest, '
+              'ignoring distributed_workers for {}'.format(engine_name))
+    elif n_workers > 0:
+        # the trees are split between several workers and merged in one model
+        print('------> Distributed training with {} workers'.format(n_workers))
+        return train_distributed_forest(X_train, y_train, model_config, n_workers,
+                                        queue_dir=model_config.get('distributed_queue_dir'),
+                                        n_jobs=n_jobs, random_state=50,
+                                        timeout=model_config.get('distributed_timeout', 3600))
+
+    # model definition (engine chosen in the settings)
+    print('------> Training engine: {}'.format(engine_name))
+    model = engine['build'](model_config, X_train, n_jobs)
+
+    # Fitting the model with the training data. The native threads (OpenMP, BLAS)
+    # are limited to the cores given to the job
+    if n_jobs > 0:
+        with threadpool_limits(limits=n_jobs):
+            model.fit(X_train, y_train)
+    else:
+        model.fit(X_train, y_train)
 
-    # saving the modil in IBM COS
-    print('------> Saving the model {} object on the cloud'.format('model_'+str(int(ts))))
-    save_model(model, 'model',  ts)
+    return model
 
-    # Evaluation of the model and collection of relevant information
-    print('---> Evaluating the model')
-    metrics_dict = evaluate_model(model, X_test, y_test, ts, model_config['model_name'])
 
-    # Save the information of the model in the documentary database
-    print('------> Saving the model information on the cloud')
-    info_saved_check = save_model_info(model_info_db_name, metrics_dict)
+def check_data_drift(features_df, timestamp, model_config, db_name):
+    """
+        Function to check the drift of the incoming data against the
+        data of the model in production. If it stays under the threshold
+        and the model was trained with the same settings, the skipped
+        retraining is recorded in the database.
 
-    # Model info save check
-    if info_saved_check:
-        print('------> Model info saved SUCCESSFULLY!!')
-    else:
-        if info_saved_check:
-            print('------> ERROR saving the model info!!')
+        Args:
+            features_df (DataFrame):  Incoming data.
+            timestamp (float):  Temporary representation in seconds.
+            model_config (dict):  Training settings (drift_threshold is the
+            maximum PSI allowed to skip the training).
+            db_name (str):  Database name.
 
-    # Selection of the best model for production
-    print('---> Putting best model in production')
-    put_best_model_in_production(metrics_dict, model_info_db_name)
+        Returns:
+            dict. Info of the skipped training, None if the model must be trained.
+    """
+    production_info = get_production_model_info(db_name)
+    if production_info is None or 'data_profile' not in production_info:
+        print('------> No data profile in production, training is required')
+        return None
+
+    # any change in the settings of the model (engine, hyperparameters, data) requires a new model
+    if production_info.get('model_config') is None or \
+            get_training_settings(production_info['model_config']) != get_training_settings(model_config):
+        print('------> Training settings changed since the model in production, training is required')
+        return None
+
+    drift_threshold = model_config['drift_threshold']
+    drift = compute_drift(production_info['data_profile'], features_df)
+    max_drift = max(drift.values(), default=0.0)
+    print('------> Maximum data drift (PSI): {}'.format(str(round(max_drift, 4))))
+    if max_drift >= drift_threshold:
+        return None
+
+    print('------> Data drift under the threshold, SKIPPING the training')
+    skip_info = {}
+    skip_info['_id'] = 'skip_' + str(int(timestamp))
+    skip_info['name'] = 'skip_' + str(int(timestamp))
+    skip_info['date'] = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
+    skip_info['reference_model'] = production_info['_id']
+    skip_info['drift'] = drift
+    skip_info['drift_threshold'] = drift_threshold
+    skip_info['status'] = 'skipped'
+    save_model_info(db_name, skip_info)
+
+    return skip_info
 
 
 def save_model(obj, name, timestamp, bucket_name='deposittitanic'):
@@ -85,8 +318,11 @@ def save_model(obj, name, timestamp, bucket_name='deposittitanic'):
 
         Kwargs:
             bucket_name (str):  IBM COS repository to use.
+
+        Returns:
+            boolean. Check if the object has been saved.
     """
-    cos.save_object_in_cos(obj, name, timestamp)
+    return cos.save_object_in_cos(obj, name, timestamp, bucket_name)
 
 
 def save_model_info(db_name, metrics_dict):
@@ -101,48 +337,96 @@ def save_model_info(db_name, metrics_dict):
             boolean. Check if the document has been created.
     """
     db = client.get_database(db_name)
-    client.create_document(db, metrics_dict)
+    # the document may exist if a resumed run already saved it
+    if metrics_dict['_id'] not in db:
+        client.create_document(db, metrics_dict)
 
     return metrics_dict['_id'] in db
 
 
-def put_best_model_in_production(model_metrics, db_name):
+def put_best_model_in_production(model_metrics, db_name, checkpoint=None):
     """
         Function to put the best model into production.
 
         Args:
             model_metrics (dict):  Model info.
             db_name (str):  Database info.
+
+        Kwargs:
+            checkpoint (TrainingCheckpoint):  Checkpoint of the run. The
+            decision is saved in it before changing any document, so
+            a resumed run finishes the same promotion.
     """
 
     # connection to the chosen database
     db = client.get_database(db_name)
-    # query to bring the document with the info of the model in production
-    query = Query(db, selector={'status': {'$eq': 'in_production'}})
-    res = query()['docs']
-    #  id of the model in production
-    best_model_id = model_metrics['_id']
+    # document with the info of the model in production
+    production_info = get_production_model_info(db_name)
+    # the registry is read again, the artifacts of the model may have been deleted meanwhile
+    trained_doc = db[model_metrics['_id']]
+    trained_doc.fetch()
+    model_metrics = dict(model_metrics, artifacts_deleted=trained_doc.get('artifacts_deleted', False))
+
+    # decision of a previous attempt of the run, valid while no other model is in production
+    decision = checkpoint.state.get('promotion') if checkpoint is not None else None
+    if decision is not None and production_info is not None and \
+            production_info['_id'] not in decision.values():
+        decision = None
+
+    if decision is not None:
+        print('------> Finishing the promotion of a previous attempt')
+    else:
+        #  id of the model in production
+        decision = {'best_model_id': model_metrics['_id'], 'worse_model_id': None}
+        # in case there is a model in production
+        if production_info is not None:
+            # a comparison is made between the trained model and the model in production
+            decision['best_model_id'], decision['worse_model_id'] = get_best_model(model_metrics, production_info)
+        else:
+            # first trained model automatically goes to production
+            print('------> FIRST model going in production')
+        if checkpoint is not None:
+            checkpoint.state['promotion'] = decision
+            checkpoint.save_state()
+
+    best_model_id = decision['best_model_id']
+    # a model without artifacts in COS can never go in production
+    best_model_doc = db[best_model_id]
+    best_model_doc.fetch()
+    if best_model_doc.get('artifacts_deleted', False):
+        raise RuntimeError('The artifacts of the model {} have been deleted, '
+                           'it cannot go in production'.format(best_model_id))
 
-    # in case there is a model in production
-    if len(res) != 0:
-        # a comparison is made between the trained model and the model in production
-        best_model_id, worse_model_id = get_best_model(model_metrics, res[0])
+    if decision['worse_model_id'] is not None:
         # the worst model (between both) is marked as "NOT in production"
-        worse_model_doc = db[worse_model_id]
+        worse_model_doc = db[decision['worse_model_id']]
         worse_model_doc['status'] = 'none'
         # the markup in the DB is updated
         worse_model_doc.save()
-    else:
-        # first trained model automatically goes to production
-        print('------> FIRST model going in production')
 
     # the best model is marked as "YES in production"
-    best_model_doc = db[best_model_id]
     best_model_doc['status'] = 'in_production'
     # the markup in the DB is updated
     best_model_doc.save()
 
 
+def get_production_model_info(db_name):
+    """
+        Function to get the info of the model in production.
+
+        Args:
+            db_name (str):  Database name.
+
+        Returns:
+            dict. Model info, None if there is no model in production.
+    """
+    db = client.get_database(db_name)
+    # query to bring the document with the info of the model in production
+    query = Query(db, selector={'status': {'$eq': 'in_production'}})
+    res = query()['docs']
+    return res[0] if len(res) != 0 else None
+
+
 def get_best_model(model_metrics1, model_metrics2):
     """
         Function to compare models.
@@ -155,6 +439,13 @@ def get_best_model(model_metrics1, model_metrics2):
             str, str. Ids of the best and worst model in the comparison.
     """
 
+    # a model whose artifacts have been deleted is never the best one
+    if model_metrics1.get('artifacts_deleted', False) != model_metrics2.get('artifacts_deleted', False):
+        print('------> Model comparison: the artifacts of one of the models have been deleted')
+        if model_metrics1.get('artifacts_deleted', False):
+            return model_metrics2['_id'], model_metrics1['_id']
+        return model_metrics1['_id'], model_metrics2['_id']
+
     # model comparison using the AUC score metric.
     auc1 = model_metrics1['model_metrics']['roc_auc_score']
     auc2 = model_metrics2['model_metrics']['roc_auc_score']
@@ -2,9 +2,14 @@ from cloudant.client import Cloudant
 import ibm_boto3
 from ibm_botocore.client import Config
 from ibm_botocore.client import ClientError
+import multiprocessing
 import pickle
 from io import BytesIO
 
+# modules loaded once by the server process that starts the workers (they import
+# the app package, which opens the connections to IBM Cloudant and IBM COS)
+WORKER_PRELOAD_MODULES = ['app.src.models.train_model']
+
 
 class DocumentDB:
     """
@@ -90,6 +95,9 @@ class IBMCOS:
 
             Kwargs:
                 bucket_name (str): chosen COS deposit.
+
+            Returns:
+               boolean. Check if the object has been saved.
         """
 
         # objeto serializado
@@ -104,8 +112,12 @@ class IBMCOS:
             )
         except ClientError as be:
             print("CLIENT ERROR: {0}\n".format(be))
+            return False
         except Exception as e:
             print("Unable to create object: {0}".format(e))
+            return False
+
+        return True
 
     def get_object_in_cos(self, key, bucket_name='deposittitanic'):
         """
@@ -129,3 +141,70 @@ class IBMCOS:
             # des-serialización del objeto descargado
             obj = pickle.load(data)
         return obj
+
+    def get_object_size(self, key, bucket_name='deposittitanic'):
+        """
+            Function to get the size of an IBM COS object.
+
+            Args:
+               key (str):  Name of the object in COS.
+
+            Kwargs:
+                bucket_name (str): chosen COS repository.
+
+            Returns:
+               int. Size of the object in bytes.
+        """
+        return self.connection.Object(bucket_name, key).content_length
+
+    def delete_objects_in_cos(self, keys, bucket_name='deposittitanic', batch_size=1000):
+        """
+            Function to delete IBM COS objects using batched
+            multi-object deletes.
+
+            Args:
+               keys (list):  Names of the objects to delete.
+
+            Kwargs:
+                bucket_name (str): chosen COS repository.
+                batch_size (int): Objects deleted in each request (1000 at most).
+
+            Returns:
+               list. Names of the objects that could not be deleted.
+        """
+        bucket = self.connection.Bucket(bucket_name)
+        failed_keys = []
+
+        for i in range(0, len(keys), batch_size):
+            batch = keys[i:i + batch_size]
+            try:
+                # only the errors are returned in quiet mode
+                res = bucket.delete_objects(Delete={'Objects': [{'Key': key} for key in batch],
+                                                    'Quiet': True})
+                failed_keys += [error['Key'] for error in res.get('Errors', [])]
+            except ClientError as be:
+                print("CLIENT ERROR: {0}\n".format(be))
+                failed_keys += batch
+            except Exception as e:
+                print("Unable to delete objects: {0}".format(e))
+                failed_keys += batch
+
+        return failed_keys
+
+
+def get_worker_context():
+    """
+        Function to get the multiprocessing context of the training and
+        evaluation workers. The workers are started by a forkserver process
+        (forking the web server would copy its threads and locks) that has
+        already loaded the app modules, so they are not imported again nor
+        new connections opened by each worker.
+
+        Returns:
+            multiprocessing-context. Context to start the workers.
+    """
+    context = multiprocessing.get_context('forkserver')
+    # run.py is left out, the server process does not start a Flask app
+    context.set_forkserver_preload(WORKER_PRELOAD_MODULES)
+
+    return context
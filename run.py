@@ -1,6 +1,9 @@
 from flask import Flask
 import os
 from app.src.models import train_model
+from app.src.models.artifacts import collect_artifacts_garbage
+from app.src.models.checkpoint import clear_old_checkpoints
+from app.src.models.scheduler import TrainingScheduler, get_request_fingerprint
 from app import ROOT_DIR
 import warnings
 
@@ -13,6 +16,11 @@ app = Flask(__name__)
 # When running this app on the local machine, default the port to 8000
 port = int(os.getenv('PORT', 8000))
 
+# Scheduler shared by all the training requests. The CPU budget and the cores
+# given to each fit can be set with environment variables
+scheduler = TrainingScheduler(cpu_budget=int(os.getenv('TRAIN_CPU_BUDGET', 0)) or None,
+                              cores_per_job=int(os.getenv('TRAIN_CORES_PER_JOB', 0)) or None)
+
 
 # Using the decorator @app.route to manage routers
 # root path "/"
@@ -40,13 +48,81 @@ def train_model_route():
     # Path for local data upload
     df_path = os.path.join(ROOT_DIR, 'data/data.csv')
 
-    # Run the training pipeline of our model
-    train_model.training_pipeline(df_path)
+    # Loading training settings to fingerprint the request
+    config_doc = train_model.load_model_config('titanic_db')
+    fingerprint = get_request_fingerprint(df_path, config_doc)
+
+    # Run the training pipeline of our model (identical requests share the same run)
+    try:
+        model_info = scheduler.run(fingerprint, train_model.training_pipeline, df_path,
+                                   model_config=config_doc['model_config'])
+    except FileExistsError as e:
+        # another run started in the same second (the models would share the id)
+        return {'TRAINING_MODEL': str(e)}, 409
+    except train_model.TrainingStageError as e:
+        # the run can be resumed from the last completed stage
+        return {'TRAINING_MODEL': str(e),
+                'RESUME': '/resume-training/{}'.format(int(e.timestamp))}, 500
+
+    # the data has not drifted from the model in production
+    if model_info['status'] == 'skipped':
+        return {'TRAINING_MODEL': 'Skipped, no data drift',
+                'REFERENCE_MODEL': model_info['reference_model'],
+                'DRIFT': model_info['drift']}
 
     # Anything we want can be returned (training success message, metrics, etc.)
     return {'TRAINING_MODEL': 'Successfully trained'}
 
 
+# route to resume a failed training run
+@app.route('/resume-training/<int:timestamp>', methods=['GET'])
+def resume_training_route(timestamp):
+    """
+        Function to resume a training run from its last completed stage.
+
+        Args:
+           timestamp (int):  Timestamp of the run.
+
+        Returns:
+           dict.  Output message
+    """
+    try:
+        scheduler.run('resume_{}'.format(timestamp), train_model.resume_training_pipeline, timestamp)
+    except ValueError as e:
+        return {'TRAINING_MODEL': str(e)}, 404
+    except train_model.TrainingStageError as e:
+        return {'TRAINING_MODEL': str(e),
+                'RESUME': '/resume-training/{}'.format(int(e.timestamp))}, 500
+
+    return {'TRAINING_MODEL': 'Successfully trained'}
+
+
+# route to delete the artifacts of old models
+@app.route('/gc-artifacts', methods=['POST'])
+def gc_artifacts_route():
+    """
+        Function to delete the COS artifacts of the models that are not
+        in production, following the retention settings, and the old
+        checkpoints of training runs.
+
+        Returns:
+           dict.  Output message
+    """
+    model_config = train_model.load_model_config('titanic_db')['model_config']
+    # no model can be promoted while its artifacts are being deleted
+    with train_model.promotion_lock:
+        deleted_ids = collect_artifacts_garbage('titanic_db',
+                                                retention_count=model_config.get('retention_count'),
+                                                retention_days=model_config.get('retention_days'),
+                                                checkpoint_dir=train_model.CHECKPOINT_DIR)
+
+    # local checkpoints of failed runs that have not been resumed
+    removed_runs = clear_old_checkpoints(train_model.CHECKPOINT_DIR,
+                                         model_config.get('checkpoint_retention_days', 7))
+
+    return {'DELETED_MODEL_ARTIFACTS': deleted_ids, 'DELETED_CHECKPOINTS': removed_runs}
+
+
 # main
 if __name__ == '__main__':
     # Run the app